@@ -0,0 +1,226 @@
+import hashlib
+import json
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+import pandas as pd
+
+from bgviewer.remote import is_remote
+
+"""
+    Resource pooling for holding several atlases in a single session.
+    Small assets are keyed by their content, so that assets shared between
+    atlases (e.g. an identical structures.json across resolutions of the
+    same atlas) are only read once, and volumes held in memory are kept
+    within a memory budget.
+"""
+
+BLOCK_SIZE = 1024 * 1024
+
+DEFAULT_MEMORY_BUDGET = 4 * 1024 ** 3
+
+
+def file_key(path):
+    """
+        Identifies a file by its path, size and modification time,
+        to detect when it has changed without reading it
+    """
+    stat = path.stat()
+    return (str(path), stat.st_size, getattr(stat, "st_mtime", None))
+
+
+def file_digest(path, block_size=BLOCK_SIZE):
+    """
+        Returns a digest of the full content of the file at path
+    """
+    digest = hashlib.sha1()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def volume_nbytes(volume):
+    """
+        Returns the number of bytes a volume holds in memory:
+        lazy (e.g. dask) arrays are only read when displayed
+        and don't count towards the memory budget
+    """
+    if isinstance(volume, np.ndarray):
+        return volume.nbytes
+    return 0
+
+
+class ContentCache:
+    def __init__(self):
+        """
+            Loads each distinct file content once and hands
+            out the same object to every atlas that references it.
+        """
+        self._digests = {}  # file key -> content digest
+        self._objects = {}  # content digest -> loaded object
+
+    def __len__(self):
+        return len(self._objects)
+
+    def digest(self, path):
+        """
+            Returns the content digest of a file, which is
+            only computed again if the file has changed.
+            Remote files are identified by their url and version
+            instead, as hashing them would download them entirely.
+        """
+        if is_remote(path):
+            stat = path.stat()
+            return f"{path}@{stat.version or stat.st_size}"
+
+        key = file_key(path)
+        if key not in self._digests:
+            self._digests[key] = file_digest(path)
+        return self._digests[key]
+
+    def load(self, path, loader):
+        """
+            Returns the object loaded from path, calling
+            loader(path) only if no file with the same content
+            has been loaded before.
+        """
+        digest = self.digest(path)
+        if digest not in self._objects:
+            self._objects[digest] = loader(path)
+        return self._objects[digest]
+
+
+class MemoryBudget:
+    def __init__(self, max_bytes, on_evict=None):
+        """
+            Keeps track of large objects (volumes) in least recently
+            viewed order, evicting the oldest ones when the total size
+            goes over max_bytes. The most recent entry is never evicted.
+
+            Arguments
+            ---------
+            max_bytes: memory budget in bytes
+            on_evict: optional callable, called as on_evict(key, obj)
+                for every evicted entry
+        """
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.used_bytes = 0
+        self._entries = OrderedDict()  # key -> (object, nbytes)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key, obj, nbytes):
+        self.discard(key)
+        self._entries[key] = (obj, nbytes)
+        self.used_bytes += nbytes
+        self._evict()
+
+    def get(self, key):
+        """
+            Returns the object stored under key (or None) and
+            marks it as the most recently viewed.
+        """
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def discard(self, key):
+        if key in self._entries:
+            _, nbytes = self._entries.pop(key)
+            self.used_bytes -= nbytes
+
+    def _evict(self):
+        while self.used_bytes > self.max_bytes and len(self._entries) > 1:
+            key, (obj, nbytes) = self._entries.popitem(last=False)
+            self.used_bytes -= nbytes
+            if self.on_evict is not None:
+                self.on_evict(key, obj)
+
+
+class AtlasSession:
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, on_evict=None):
+        """
+            Holds multiple atlases at once, sharing identical assets
+            between them through a ContentCache and keeping loaded
+            volumes within a MemoryBudget. Volumes can be several GB, so
+            they are identified by their file (see file_key) rather
+            than hashed.
+
+            Arguments
+            ---------
+            memory_budget: maximum number of bytes of volume data to keep
+            on_evict: optional callable, called with the set of view names
+                (as passed to load_volume) whose volume has been evicted
+        """
+        self.atlases = OrderedDict()  # atlas name -> atlas directory
+        self.cache = ContentCache()
+        self.volumes = MemoryBudget(
+            memory_budget, on_evict=self._volume_evicted
+        )
+        self.on_evict = on_evict
+        self._views = defaultdict(set)  # volume file key -> view names
+
+    def add_atlas(self, atlas_directory):
+        """
+            Adds an atlas to the session and returns its name
+        """
+        name = atlas_directory.name
+        self.atlases[name] = atlas_directory
+        return name
+
+    def remove_atlas(self, name):
+        del self.atlases[name]
+
+    def load_structures(self, structures_path):
+        def read_structures(path):
+            with path.open() as json_file:
+                return pd.read_json(json_file)
+
+        return self.cache.load(structures_path, read_structures)
+
+    def load_metadata(self, metadata_path):
+        def read_metadata(path):
+            with path.open() as json_file:
+                return json.load(json_file)
+
+        return self.cache.load(metadata_path, read_metadata)
+
+    def load_volume(self, volume_path, loader, view):
+        """
+            Returns the volume at volume_path, loading it with loader
+            if it is not already held in memory.
+
+            Arguments
+            ---------
+            volume_path: path to the volume file
+            loader: callable returning the volume given its path
+            view: name under which the volume is being displayed,
+                passed back to on_evict when the volume is dropped
+        """
+        key = file_key(volume_path)
+        volume = self.volumes.get(key)
+        if volume is None:
+            volume = loader(volume_path)
+            self.volumes.add(key, volume, volume_nbytes(volume))
+        self._views[key].add(view)
+        return volume
+
+    def view_volume(self, view):
+        """
+            Marks the volume displayed as view as the most recently viewed
+        """
+        for key, views in self._views.items():
+            if view in views:
+                self.volumes.get(key)
+
+    def _volume_evicted(self, key, volume):
+        views = self._views.pop(key, set())
+        if self.on_evict is not None:
+            self.on_evict(views)
@@ -0,0 +1,143 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bgviewer.atlas_pool import MemoryBudget
+from bgviewer.remote import lazy_tiff
+
+"""
+    Loading of registered sample channels (volumes in atlas space) as
+    lazy, multiscale layers. All channels share a single cache of
+    the planes read, with a common memory budget.
+"""
+
+DEFAULT_CHUNK_CACHE_BUDGET = 1024 ** 3
+CHANNEL_EXTENSIONS = (".tif", ".tiff")
+
+# Downsample in plane until the smallest level is at most this size
+MIN_LEVEL_SIZE = 512
+
+
+class ChunkCache:
+    def __init__(self, max_bytes=DEFAULT_CHUNK_CACHE_BUDGET):
+        """
+            Thread safe cache of chunks (numpy arrays) shared
+            by all channels, least recently used chunks are
+            evicted when max_bytes is exceeded
+        """
+        self._budget = MemoryBudget(max_bytes)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._budget)
+
+    @property
+    def used_bytes(self):
+        return self._budget.used_bytes
+
+    def get(self, key):
+        with self._lock:
+            return self._budget.get(key)
+
+    def add(self, key, chunk):
+        with self._lock:
+            self._budget.add(key, chunk, chunk.nbytes)
+
+
+class Channel:
+    def __init__(self, name, levels, contrast_limits):
+        """
+            A lazily loaded channel, with levels from
+            full resolution to the most downsampled
+        """
+        self.name = name
+        self.levels = levels
+        self.contrast_limits = contrast_limits
+
+
+def multiscale_levels(path, chunk_cache=None, min_size=MIN_LEVEL_SIZE):
+    """
+        Returns a list of increasingly downsampled (by 2 in plane)
+        lazy volumes read from a tiff file. Planes are only downsampled
+        in plane, as the volume is sliced along its first axis. Each
+        level reads and caches its own downsampled planes, so viewing a
+        low resolution level never keeps full resolution planes.
+    """
+    levels = [lazy_tiff(path, chunk_cache=chunk_cache)]
+    while min(levels[-1].shape[-2:]) > min_size:
+        levels.append(
+            lazy_tiff(path, chunk_cache, downsample=2 ** len(levels))
+        )
+    return levels
+
+
+def estimate_contrast_limits(volume, n_samples=8, percentiles=(0.5, 99.5)):
+    """
+        Estimates contrast limits from a few evenly spaced planes
+        rather than reading the full volume
+    """
+    n_planes = volume.shape[0]
+    indices = np.unique(
+        np.linspace(0, n_planes - 1, min(n_samples, n_planes)).astype(int)
+    )
+    samples = np.asarray(volume[indices])
+    low, high = np.percentile(samples, percentiles)
+    if high <= low:
+        high = low + 1
+    return [float(low), float(high)]
+
+
+def open_channel(path, chunk_cache, n_samples=8, name=None):
+    levels = multiscale_levels(path, chunk_cache)
+    return Channel(
+        name or path.stem,
+        levels,
+        estimate_contrast_limits(levels[0], n_samples=n_samples),
+    )
+
+
+def channel_names(paths):
+    """
+        Names channels after their file names without the extension,
+        keeping the extension for files that would otherwise share
+        a name (e.g. brain.tif and brain.tiff)
+    """
+    stems = [path.stem for path in paths]
+    return [
+        path.name if stems.count(stem) > 1 else stem
+        for path, stem in zip(paths, stems)
+    ]
+
+
+def find_channels(directory):
+    return sorted(
+        path
+        for path in directory.iterdir()
+        if path.suffix.lower() in CHANNEL_EXTENSIONS
+    )
+
+
+def load_channels(paths, chunk_cache, n_samples=8, max_workers=4):
+    """
+        Opens several channels concurrently. Only the planes sampled
+        to estimate the contrast limits are read.
+
+        Arguments
+        ---------
+        paths: paths to the channels' tiff files
+        chunk_cache: ChunkCache shared by all channels
+        n_samples: number of planes used to estimate contrast limits
+        max_workers: maximum number of channels opened in parallel
+    """
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(
+            executor.map(
+                lambda path, name: open_channel(
+                    path, chunk_cache, n_samples, name
+                ),
+                paths,
+                channel_names(paths),
+            )
+        )
@@ -22,8 +22,8 @@ def atlas_value_to_name(atlas_value, structures_reference_df):
     return str(name.values[0])
 
 
-def display_brain_region_name(layer, structures_df):
-    val = layer.get_value()
+def display_brain_region_name(layer, structures_df, get_value=None):
+    val = layer.get_value() if get_value is None else get_value()
     if val != 0 and val is not None:
         try:
             region = atlas_value_to_name(val, structures_df)
@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+"""
+    Outlines of annotation labels, computed lazily one 2d slice at a time
+    so that only the displayed slices (and their neighbours, in the
+    background) are ever processed.
+"""
+
+
+def slice_boundaries(labels):
+    """
+        Returns a copy of a 2d labels image where only pixels on the
+        boundary between two labels keep their value, all others are 0.
+        Boundaries are found by comparing each pixel with its neighbours.
+    """
+    labels = np.asarray(labels)
+    boundary = np.zeros(labels.shape, dtype=bool)
+
+    vertical = labels[1:, :] != labels[:-1, :]
+    boundary[1:, :] |= vertical
+    boundary[:-1, :] |= vertical
+
+    horizontal = labels[:, 1:] != labels[:, :-1]
+    boundary[:, 1:] |= horizontal
+    boundary[:, :-1] |= horizontal
+
+    return np.where(boundary, labels, 0)
+
+
+class OutlineVolume:
+    def __init__(self, labels, max_slices=64, prefetch=2):
+        """
+            Array-like view of the outlines of a labels volume, which
+            can be displayed as a napari labels layer. Outlines are
+            computed over the two displayed axes of each requested 2d
+            slice, whatever its orientation, and cached. The neighbouring
+            slices are precomputed in a background thread.
+            Outlines are only computed for 2d slices: requests spanning
+            more than two axes (e.g. the 3d view) return empty labels, to
+            never process the full volume.
+
+            Arguments
+            ---------
+            labels: labels volume (e.g. a numpy or dask array), ideally
+                chunked by plane so that each slice is cheap to read
+            max_slices: maximum number of slices to keep in the cache
+            prefetch: number of slices to precompute on either side
+                of each requested slice
+        """
+        self.labels = labels
+        self.shape = tuple(labels.shape)
+        self.dtype = labels.dtype
+        self.ndim = len(self.shape)
+        self.max_slices = max_slices
+        self.prefetch = prefetch
+
+        # slices are identified by the (axes, indices) of their fixed axes
+        self._cache = OrderedDict()  # slice -> outlines
+        self._pending = {}  # slice -> future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def label_at(self, coordinates):
+        """
+            Returns the label (not its outline) at the given data
+            coordinates, or None if they are outside of the volume
+        """
+        index = tuple(int(np.round(c)) for c in coordinates[-self.ndim :])
+        if not all(0 <= i < size for i, size in zip(index, self.shape)):
+            return None
+        return np.asarray(self.labels[index]).item()
+
+    def _compute(self, axes, indices):
+        key = [slice(None)] * self.ndim
+        for axis, index in zip(axes, indices):
+            key[axis] = index
+        outlines = slice_boundaries(self.labels[tuple(key)])
+
+        with self._lock:
+            self._cache[(axes, indices)] = outlines
+            self._pending.pop((axes, indices), None)
+            while len(self._cache) > self.max_slices:
+                self._cache.popitem(last=False)
+        return outlines
+
+    def get_slice(self, axes, indices):
+        """
+            Returns the outlines of the 2d slice at the given indices
+            along the fixed axes (all axes but the two displayed ones)
+        """
+        with self._lock:
+            outlines = self._cache.get((axes, indices))
+            future = self._pending.get((axes, indices))
+            if outlines is not None:
+                self._cache.move_to_end((axes, indices))
+
+        if outlines is None:
+            if future is not None:
+                outlines = future.result()
+            else:
+                outlines = self._compute(axes, indices)
+
+        self._prefetch_neighbours(axes, indices)
+        return outlines
+
+    def _prefetch_neighbours(self, axes, indices):
+        """
+            Precomputes the slices next to the requested one along the
+            last fixed axis (the one scrolled through in napari)
+        """
+        if not axes:
+            return
+
+        *lead, position = indices
+        for offset in range(1, self.prefetch + 1):
+            for neighbour in (position - offset, position + offset):
+                if not 0 <= neighbour < self.shape[axes[-1]]:
+                    continue
+                neighbour = (axes, tuple(lead) + (neighbour,))
+                with self._lock:
+                    if neighbour in self._cache or neighbour in self._pending:
+                        continue
+                    self._pending[neighbour] = self._executor.submit(
+                        self._compute, *neighbour
+                    )
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        sliced = [axis for axis, k in enumerate(key) if isinstance(k, slice)]
+        if len(sliced) > 2:
+            # not a 2d slice, outlines are not computed
+            shape = [
+                len(range(*k.indices(size)))
+                for k, size in zip(key, self.shape)
+                if isinstance(k, slice)
+            ]
+            return np.zeros(shape, self.dtype)
+
+        # the two displayed axes are the sliced ones, completed with the
+        # last indexed axes if fewer than two axes are sliced
+        indexed = [axis for axis in range(self.ndim) if axis not in sliced]
+        n_missing = 2 - len(sliced)
+        displayed = sorted(sliced + indexed[len(indexed) - n_missing :])
+        axes = tuple(
+            axis for axis in range(self.ndim) if axis not in displayed
+        )
+        indices = tuple(int(key[axis]) % self.shape[axis] for axis in axes)
+
+        outlines = self.get_slice(axes, indices)
+        return outlines[tuple(key[axis] for axis in displayed)]
@@ -0,0 +1,309 @@
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+import dask.array as da
+import numpy as np
+import tifffile
+from dask import delayed
+
+"""
+    Streaming of atlases stored on a web server or an object store with
+    an http endpoint. Files are fetched on demand in fixed size blocks
+    with http range requests (several blocks in parallel) and the blocks
+    are cached on the local disk, so that only the parts of an atlas that
+    are actually viewed are downloaded.
+"""
+
+BLOCK_SIZE = 1024 * 1024
+DEFAULT_CACHE_DIR = Path.home() / ".bgviewer" / "remote_cache"
+
+
+def is_remote(location):
+    return urlparse(str(location)).scheme in ("http", "https")
+
+
+class RemoteStore:
+    def __init__(self, cache_dir=None, block_size=BLOCK_SIZE, max_workers=8):
+        """
+            Fetches and caches blocks of remote files.
+
+            Arguments
+            ---------
+            cache_dir: directory where downloaded blocks are cached
+            block_size: size (in bytes) of each range request
+            max_workers: maximum number of blocks fetched in parallel
+        """
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+        self.block_size = block_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._pending = {}  # (url, block) -> future
+        self._heads = {}  # url -> (file size, version)
+
+    def _head(self, url):
+        if url not in self._heads:
+            with urlopen(Request(url, method="HEAD")) as response:
+                headers = response.headers
+                self._heads[url] = (
+                    int(headers["Content-Length"]),
+                    headers.get("ETag") or headers.get("Last-Modified"),
+                )
+        return self._heads[url]
+
+    def size(self, url):
+        return self._head(url)[0]
+
+    def version(self, url):
+        """
+            Returns the ETag (or last modification date) of
+            the file at url, or None if the server sends neither
+        """
+        return self._head(url)[1]
+
+    def _block_path(self, url, block):
+        # blocks of a file replaced on the server are never reused
+        version = f"{url}@{self.size(url)}@{self.version(url)}"
+        url_hash = hashlib.sha1(version.encode()).hexdigest()[:16]
+        return self.cache_dir / url_hash / f"{self.block_size}_{block}"
+
+    def _fetch_block(self, url, block):
+        block_path = self._block_path(url, block)
+        if block_path.exists():
+            return block_path.read_bytes()
+
+        start = block * self.block_size
+        end = min(start + self.block_size, self.size(url)) - 1
+        request = Request(url, headers={"Range": f"bytes={start}-{end}"})
+        with urlopen(request) as response:
+            data = response.read()
+            if response.status != 206:
+                # the server ignored the range request
+                data = data[start : end + 1]
+
+        # write to a temporary file first so that partially
+        # written blocks are never read from the cache
+        block_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = block_path.with_name(
+            f"{block_path.name}.{threading.get_ident()}.tmp"
+        )
+        tmp_path.write_bytes(data)
+        os.replace(str(tmp_path), str(block_path))
+        return data
+
+    def _submit(self, url, block):
+        """
+            Returns a future for a block, reusing the one
+            already in flight if the block is being fetched
+        """
+        key = (url, block)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._fetch_block, url, block)
+                self._pending[key] = future
+                future.add_done_callback(
+                    lambda _: self._pending.pop(key, None)
+                )
+        return future
+
+    def read(self, url, start, length):
+        """
+            Returns length bytes of the file at url starting at start,
+            fetching all blocks that are not cached in parallel
+        """
+        if length <= 0:
+            return b""
+        first = start // self.block_size
+        last = (start + length - 1) // self.block_size
+        futures = [self._submit(url, b) for b in range(first, last + 1)]
+        data = b"".join(future.result() for future in futures)
+        offset = start - first * self.block_size
+        return data[offset : offset + length]
+
+
+class RemoteStat:
+    def __init__(self, st_size, version=None):
+        self.st_size = st_size
+        self.version = version
+
+
+class RemoteFile(io.RawIOBase):
+    def __init__(self, path):
+        """
+            Read-only, seekable binary file backed by a RemotePath
+        """
+        super().__init__()
+        self.path = path
+        self.size = path.stat().st_size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self.position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        data = self.path.store.read(self.path.url, self.position, length)
+        buffer[:length] = data
+        self.position += length
+        return length
+
+
+class RemotePath:
+    def __init__(self, url, store=None):
+        """
+            Minimal pathlib.Path-like interface to a remote file
+            or directory, so that remote atlases can be used
+            wherever a local atlas directory is expected.
+
+            Arguments
+            ---------
+            url: url of the file or directory
+            store: RemoteStore used to fetch the data
+        """
+        self.url = str(url).rstrip("/")
+        self.store = store or RemoteStore()
+
+    def __str__(self):
+        return self.url
+
+    def __repr__(self):
+        return f"RemotePath({self.url!r})"
+
+    def __truediv__(self, other):
+        return RemotePath(f"{self.url}/{other}", store=self.store)
+
+    @property
+    def name(self):
+        return urlparse(self.url).path.rstrip("/").split("/")[-1]
+
+    def stat(self):
+        return RemoteStat(
+            self.store.size(self.url), self.store.version(self.url)
+        )
+
+    def exists(self):
+        try:
+            self.stat()
+        except OSError:
+            return False
+        return True
+
+    def open(self, mode="r", encoding="utf-8"):
+        if mode not in ("r", "rb"):
+            raise ValueError(f"Remote files can only be read, got: {mode}")
+
+        raw = io.BufferedReader(RemoteFile(self))
+        if mode == "rb":
+            return raw
+        return io.TextIOWrapper(raw, encoding=encoding)
+
+    def read_bytes(self):
+        with self.open("rb") as f:
+            return f.read()
+
+    def read_text(self, encoding="utf-8"):
+        with self.open(encoding=encoding) as f:
+            return f.read()
+
+
+def lazy_tiff(path, chunk_cache=None, downsample=1):
+    """
+        Returns a dask array reading a (local or remote) 3d tiff
+        one plane at a time, so that only the planes that are
+        viewed are read (or fetched).
+
+        Arguments
+        ---------
+        path: local path or RemotePath of the tiff file
+        chunk_cache: optional cache (see bgviewer.channels.ChunkCache)
+            where the planes read are kept
+        downsample: in plane downsampling factor. Planes are downsampled
+            as they are read, so that only the downsampled planes are
+            kept in the cache.
+    """
+    with path.open("rb") as f:
+        with tifffile.TiffFile(f) as tif:
+            series = tif.series[0]
+            shape = tuple(series.shape)
+            file_dtype = np.dtype(series.dtype).newbyteorder(tif.byteorder)
+            offset = getattr(
+                series, "dataoffset", getattr(series, "offset", None)
+            )
+    dtype = file_dtype.newbyteorder("=")
+    every = slice(None, None, downsample)
+    step = (Ellipsis, every, every)
+    shape = shape[:-2] + tuple(
+        len(range(0, size, downsample)) for size in shape[-2:]
+    )
+
+    def cached(read, key):
+        if chunk_cache is None:
+            return read()
+        chunk = chunk_cache.get(key)
+        if chunk is None:
+            chunk = read()
+            chunk_cache.add(key, chunk)
+        return chunk
+
+    if offset is None or len(shape) < 3:
+        # not contiguous: the volume can only be read as a whole
+        def read_volume():
+            with path.open("rb") as f:
+                return np.ascontiguousarray(tifffile.imread(f)[step])
+
+        volume = delayed(cached)(read_volume, (str(path), downsample, None))
+        return da.from_delayed(volume, shape, dtype)
+
+    file_plane_shape = tuple(series.shape[1:])
+    plane_bytes = int(np.prod(file_plane_shape)) * file_dtype.itemsize
+
+    def read_plane(index):
+        start = offset + index * plane_bytes
+        if is_remote(path):
+            # read from the store directly: a buffered file would read
+            # ahead and fetch the blocks of the next plane too
+            data = path.store.read(path.url, start, plane_bytes)
+        else:
+            with path.open("rb") as f:
+                f.seek(start)
+                data = f.read(plane_bytes)
+        plane = np.frombuffer(data, file_dtype).reshape(file_plane_shape)
+        return plane[step].astype(dtype)
+
+    planes = [
+        da.from_delayed(
+            delayed(cached)(
+                partial(read_plane, i), (str(path), downsample, i)
+            ),
+            shape[1:],
+            dtype,
+        )
+        for i in range(shape[0])
+    ]
+    return da.stack(planes)
@@ -1,26 +1,49 @@
 import napari
-import json
-import pandas as pd
 
 from pathlib import Path
 from napari.utils.io import magic_imread
 from qtpy import QtCore
 from qtpy.QtWidgets import (
     QGridLayout,
+    QInputDialog,
     QWidget,
     QTextBrowser,
     QLabel,
 )
 
+from bgviewer.atlas_pool import AtlasSession, DEFAULT_MEMORY_BUDGET
+from bgviewer.channels import (
+    ChunkCache,
+    DEFAULT_CHUNK_CACHE_BUDGET,
+    find_channels,
+    load_channels,
+)
 from bgviewer.display_region_name import display_brain_region_name
+from bgviewer.outlines import OutlineVolume
 from bgviewer.gui_utils import add_button, choose_directory_dialog
+from bgviewer.remote import RemotePath, RemoteStore, is_remote, lazy_tiff
+
+CHANNEL_COLORMAPS = ["green", "magenta", "cyan", "red", "blue", "yellow"]
 
 
 class ViewerWidget(QWidget):
-    def __init__(self, viewer, annotations_opacity=0.3):
+    def __init__(
+        self,
+        viewer,
+        annotations_opacity=0.3,
+        memory_budget=DEFAULT_MEMORY_BUDGET,
+        remote_cache_dir=None,
+        chunk_cache_budget=DEFAULT_CHUNK_CACHE_BUDGET,
+    ):
         super(ViewerWidget, self).__init__()
         self.viewer = viewer
         self.annotations_opacity = annotations_opacity
+        self.remote_store = RemoteStore(cache_dir=remote_cache_dir)
+        self.chunk_cache = ChunkCache(max_bytes=chunk_cache_budget)
+        self.session = AtlasSession(
+            memory_budget=memory_budget, on_evict=self.remove_layers
+        )
+        self.viewer.events.active_layer.connect(self.on_active_layer)
         self.setup_layout()
 
     def setup_layout(self):
@@ -30,11 +53,14 @@ class ViewerWidget(QWidget):
         self.load_atlas_button = add_button(
             "Load atlas", layout, self.load_atlas, 0, 0, minimum_width=200,
         )
+        self.load_remote_atlas_button = add_button(
+            "Load remote atlas", layout, self.load_remote_atlas, 1, 0,
+        )
         self.load_reference_button = add_button(
             "Load reference image",
             layout,
             self.load_reference,
-            1,
+            2,
             0,
             visibility=False,
         )
@@ -42,7 +68,23 @@ class ViewerWidget(QWidget):
             "Load annotated image",
             layout,
             self.load_annotated,
-            2,
+            3,
+            0,
+            visibility=False,
+        )
+        self.load_outlines_button = add_button(
+            "Load annotation outlines",
+            layout,
+            self.load_outlines,
+            4,
+            0,
+            visibility=False,
+        )
+        self.load_channels_button = add_button(
+            "Load sample channels",
+            layout,
+            self.load_channels,
+            5,
             0,
             visibility=False,
         )
@@ -53,7 +95,7 @@ class ViewerWidget(QWidget):
 
         self.status_label.setText("Ready")
 
-        layout.addWidget(self.status_label, 4, 0)
+        layout.addWidget(self.status_label, 6, 0)
 
         self.info_box = QTextBrowser()
         self.info_box.setVisible(False)
@@ -68,16 +110,47 @@ class ViewerWidget(QWidget):
 
         # deal with existing dialog
         if directory != "":
-            self.atlas_directory = Path(directory)
-            self.initialise_atlas_paths()
-            self.load_structures()
-            self.load_atlas_button.setText("Load new atlas")
-            self.load_reference_button.setVisible(True)
-            self.load_annotated_button.setVisible(True)
-            self.fill_info_box()
+            self.open_atlas(Path(directory))
+
+        self.status_label.setText("Ready")
+
+    def load_remote_atlas(self):
+        self.status_label.setText("Loading...")
+        url, ok = QInputDialog.getText(
+            self, "Load remote atlas", "Atlas URL:"
+        )
+
+        if ok and url != "":
+            if not is_remote(url):
+                self.status_label.setText(f"Not a valid atlas URL: {url}")
+                return
+            try:
+                self.open_atlas(RemotePath(url, store=self.remote_store))
+            except OSError as error:
+                # e.g. unreachable host or missing atlas files
+                self.status_label.setText(
+                    f"Could not load remote atlas {url}: {error}"
+                )
+                return
 
         self.status_label.setText("Ready")
 
+    def open_atlas(self, atlas_directory):
+        """
+            atlas_directory can be a local path or a RemotePath,
+            in which case files are fetched on demand
+        """
+        self.atlas_directory = atlas_directory
+        self.atlas_name = self.session.add_atlas(self.atlas_directory)
+        self.initialise_atlas_paths()
+        self.load_structures()
+        self.load_atlas_button.setText("Load another atlas")
+        self.load_reference_button.setVisible(True)
+        self.load_annotated_button.setVisible(True)
+        self.load_outlines_button.setVisible(True)
+        self.load_channels_button.setVisible(True)
+        self.fill_info_box()
+
     def initialise_atlas_paths(self):
         self.metadata_path = self.atlas_directory / "metadata.json"
         self.structures_path = self.atlas_directory / "structures.json"
@@ -86,7 +159,7 @@ class ViewerWidget(QWidget):
         self.meshes_dir = self.atlas_directory / "meshes"
 
     def load_structures(self):
-        self.structures = pd.read_json(self.structures_path)
+        self.structures = self.session.load_structures(self.structures_path)
 
     def fill_info_box(self):
         metadata_formatted = self.load_metadata()
@@ -95,8 +168,7 @@ class ViewerWidget(QWidget):
 
     def load_metadata(self):
         metadata_formatted = ""
-        with open(self.metadata_path) as json_file:
-            self.metadata = json.load(json_file)
+        self.metadata = self.session.load_metadata(self.metadata_path)
         for item in self.metadata:
             metadata_formatted = (
                 metadata_formatted + f"{item}: {self.metadata[item]}\n"
@@ -105,34 +177,116 @@ class ViewerWidget(QWidget):
         return metadata_formatted
 
     def load_reference(self):
-        self.load_image(self.reference_path, name="Reference")
+        self.load_image(
+            self.reference_path, name=f"{self.atlas_name} reference"
+        )
 
     def load_annotated(self):
         self.annotation_labels = self.load_labels(
             self.annotated_path,
-            name="Annotations",
+            name=f"{self.atlas_name} annotations",
             opacity=self.annotations_opacity,
         )
+        self.add_region_name_callback(self.annotation_labels)
+
+    def load_outlines(self):
+        # read by plane, so that computing the outlines of
+        # a slice doesn't read the whole annotation volume
+        annotation = lazy_tiff(self.annotated_path, self.chunk_cache)
+        outlines = OutlineVolume(annotation)
+        self.outline_labels = self.viewer.add_labels(
+            outlines, name=f"{self.atlas_name} outlines"
+        )
+        # outlines are 0 inside regions, name the region under the
+        # cursor from the annotation instead
+        outline_labels = self.outline_labels
+        self.add_region_name_callback(
+            outline_labels,
+            lambda: outlines.label_at(outline_labels.coordinates),
+        )
+
+    def load_channels(self):
+        """
+            Loads a directory of registered sample channels (tiff
+            files in atlas space) as lazy, multiscale layers sharing
+            a single chunk cache
+        """
+        self.status_label.setText("Loading...")
+        directory = choose_directory_dialog(
+            parent=self, prompt="Select channels directory"
+        )
+
+        if directory != "":
+            channels = load_channels(
+                find_channels(Path(directory)), self.chunk_cache
+            )
+            for n, channel in enumerate(channels):
+                multiscale = len(channel.levels) > 1
+                self.viewer.add_image(
+                    channel.levels if multiscale else channel.levels[0],
+                    name=channel.name,
+                    multiscale=multiscale,
+                    contrast_limits=channel.contrast_limits,
+                    colormap=CHANNEL_COLORMAPS[n % len(CHANNEL_COLORMAPS)],
+                    blending="additive",
+                )
+
+        self.status_label.setText("Ready")
+
+    def add_region_name_callback(self, labels, get_value=None):
+        # each atlas' labels keep referring to their own structures
+        structures = self.structures
 
-        @self.annotation_labels.mouse_move_callbacks.append
+        @labels.mouse_move_callbacks.append
         def display_region_name(layer, event):
-            display_brain_region_name(layer, self.structures)
+            display_brain_region_name(layer, structures, get_value)
+
+    def load_volume(self, image_path, use_dask, stack, name):
+        """
+            Local volumes are read into memory and count towards the
+            session's memory budget (older volumes are closed when it's
+            exceeded). Remote volumes are lazy: only the viewed planes
+            are fetched, and kept within the chunk cache's budget.
+        """
+        if is_remote(image_path):
+            loader = lambda path: lazy_tiff(path, self.chunk_cache)
+        else:
+            loader = lambda path: magic_imread(
+                path, use_dask=use_dask, stack=stack
+            )
+        return self.session.load_volume(image_path, loader, name)
+
+    def on_active_layer(self, event):
+        if event.item is not None:
+            self.session.view_volume(event.item.name)
+
+    def remove_layers(self, names):
+        """
+            Called when volumes are evicted from the session's
+            memory budget, removes the layers displaying them
+        """
+        for layer in list(self.viewer.layers):
+            if layer.name in names:
+                self.viewer.layers.remove(layer)
+        self.status_label.setText(
+            f"Memory budget exceeded, closed: {', '.join(sorted(names))}"
+        )
 
     def load_image(
-        self, image_path, use_dask=True, stack=True, name=None, opacity=1
+        self, image_path, use_dask=False, stack=True, name=None, opacity=1
     ):
         image = self.viewer.add_image(
-            magic_imread(image_path, use_dask=use_dask, stack=stack),
+            self.load_volume(image_path, use_dask, stack, name),
             name=name,
             opacity=opacity,
         )
         return image
 
     def load_labels(
-        self, image_path, use_dask=True, stack=True, name=None, opacity=1
+        self, image_path, use_dask=False, stack=True, name=None, opacity=1
     ):
         labels = self.viewer.add_labels(
-            magic_imread(image_path, use_dask=use_dask, stack=stack),
+            self.load_volume(image_path, use_dask, stack, name),
             name=name,
             opacity=opacity,
         )
@@ -1,5 +1,6 @@
 from PyQt5 import QtWidgets
 from bgviewer.viewer3d.gui import MainWindow
+from bgviewer.viewer3d.session import load_session, render_session
 import sys
 import argparse
 
@@ -50,16 +51,65 @@ def launch_parser():
     axes_parser.add_argument('--no-axes', dest='axes', action='store_false')
     parser.set_defaults(axes=False)
 
+    merge_parser = parser.add_mutually_exclusive_group(required=False)
+    merge_parser.add_argument('--merge-regions', dest='merge_regions', action='store_true')
+    merge_parser.add_argument('--no-merge-regions', dest='merge_regions', action='store_false')
+    parser.set_defaults(merge_regions=False)
+
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        nargs="?",
+        const="bgviewer3d_trace.json",
+        default=None,
+        help="Show frame times in the viewer and save them as a chrome trace file (default: bgviewer3d_trace.json)",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--session",
+        dest="session",
+        required=False,
+        default=None,
+        help="Path to a session file to restore (saved with ctrl+s in the viewer)",
+    )
+
+    parser.add_argument(
+        "--screenshot",
+        dest="screenshot",
+        required=False,
+        default=None,
+        help="Render the session passed with --session without the gui and save a screenshot at this path",
+    )
+
     return parser
 
 
 def main():
-    args = launch_parser().parse_args()
+    parser = launch_parser()
+    args = parser.parse_args()
+
+    if args.screenshot is not None:
+        if args.session is None:
+            parser.error("--screenshot requires --session")
+        render_session(args.session, args.screenshot)
+        return
+
+    if args.session is not None and args.atlas is not None:
+        session_atlas = load_session(args.session)["atlas"]
+        if session_atlas != args.atlas:
+            parser.error(
+                f"--session was saved with atlas {session_atlas}, "
+                + f"not {args.atlas}"
+            )
 
     launch(
         theme=args.theme,
         fullscreen=args.fullscreen,
         atlas=args.atlas,
         random_colors=args.randomcolors,
-        axes=args.axes
+        axes=args.axes,
+        profile=args.profile,
+        session=args.session,
+        merge_regions=args.merge_regions,
     )
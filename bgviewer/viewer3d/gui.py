@@ -2,13 +2,23 @@ from vedo import Plotter
 from PyQt5.QtGui import QFont
 from PyQt5.Qt import Qt
 from PyQt5 import QtCore
+from PyQt5.QtCore import QModelIndex, QPersistentModelIndex
+from PyQt5.QtWidgets import QFileDialog, QMessageBox
 
 import brainrender
 from brainrender.Utils.camera import set_camera
 from brainrender.scene import Scene
 from vedo import addons
+from vtk import vtkCellPicker, vtkPropCollection, vtkPropPicker
 
 from bgviewer.viewer3d.ui import Window
+from bgviewer.viewer3d.merge import RegionMerger
+from bgviewer.viewer3d.profiling import FrameProfiler
+from bgviewer.viewer3d.session import (
+    get_camera_params,
+    load_session,
+    save_session,
+)
 
 
 brainrender.ROOT_COLOR = [0.8, 0.8, 0.8]
@@ -25,7 +35,15 @@ brainrender.BACKGROUND_COLOR = [228, 229, 230]
 class MainWindow(Scene, Window):
     # ---------------------------------- create ---------------------------------- #
     def __init__(
-        self, *args, atlas=None, axes=None, random_colors=False, **kwargs
+        self,
+        *args,
+        atlas=None,
+        axes=None,
+        random_colors=False,
+        profile=None,
+        session=None,
+        merge_regions=False,
+        **kwargs,
     ):
         """
             Adds brainrender/vedo functionality to the 
@@ -37,7 +55,20 @@ class MainWindow(Scene, Window):
             random_colors: if True brain regions are assigned a random color
             axes: by default it's None, so no axes are shown. If True is passed
                 Cartesian coordinates axes are shown
+            profile: if not None, frame times and time spent updating
+                the scene are shown in an overlay and saved as a chrome
+                trace file at the given path when the window is closed
+            session: path to a session file saved with save_session.
+                If atlas is None the session's atlas is used.
+            merge_regions: if True all visible regions, except for the
+                one selected in the tree, are rendered as a single actor
+                which is rebuilt in the background when regions are
+                added/removed. Reduces draw calls with many regions.
         """
+        if session is not None:
+            session = load_session(session)
+            atlas = atlas or session["atlas"]
+
         self.scene = Scene(*args, atlas=atlas, **kwargs)
         Window.__init__(self, *args, **kwargs)
 
@@ -45,10 +76,25 @@ class MainWindow(Scene, Window):
 
         # Create a new vedo plotter
         self.setup_plotter()
+        self.profiler = FrameProfiler(
+            enabled=profile is not None, trace_path=profile
+        )
+        self.profiler.attach(self.vtkWidget.GetRenderWindow())
         self.random_colors = random_colors
 
+        self.merger = None
+        if merge_regions:
+            self.merger = RegionMerger()
+            self.merger.ready.connect(self._render)
+
+        # Select tree items by clicking on meshes
+        self.setup_picking()
+
         # update plotter
-        self._update()
+        if session is not None:
+            self.restore_session(session)
+        else:
+            self._update()
 
         # Add inset
         self.scene._get_inset()
@@ -89,6 +135,96 @@ class MainWindow(Scene, Window):
         # Fix camera
         set_camera(self.scene, self.scene.camera)
 
+    def setup_picking(self):
+        """
+            Clicking on a region's mesh selects the corresponding
+            item in the hierarchy tree. Actors are mapped to their
+            tree items as they are added to the scene, and picking
+            is done with a hardware (render-based) picker.
+        """
+        self.actor_items = {}  # actor -> QPersistentModelIndex
+        self.prop_picker = vtkPropPicker()
+        self.cell_picker = vtkCellPicker()
+        self.cell_picker.PickFromListOn()
+        self._click_position = None
+
+        self.vtkWidget.AddObserver("LeftButtonPressEvent", self._on_press)
+        self.vtkWidget.AddObserver("LeftButtonReleaseEvent", self._on_release)
+
+    # ---------------------------------- Picking --------------------------------- #
+    def _update_actor_items(self):
+        regions = self.scene.actors["regions"]
+        self.actor_items = {
+            actor: self.actor_items.get(actor)
+            or QPersistentModelIndex(self.tree_items[region].index())
+            for region, actor in regions.items()
+            if region in self.tree_items
+        }
+
+    def _on_press(self, interactor, event):
+        self._click_position = interactor.GetEventPosition()
+
+    def _on_release(self, interactor, event):
+        """
+            Only clicks (not drags to rotate the camera) pick regions
+        """
+        if self._click_position is None:
+            return
+        x, y = interactor.GetEventPosition()
+        x0, y0 = self._click_position
+        self._click_position = None
+        if abs(x - x0) + abs(y - y0) <= 3:
+            self.pick(x, y)
+
+    def pick(self, x, y):
+        """
+            Selects and reveals the tree item of the region
+            rendered at display coordinates x, y (if any)
+        """
+        with self.profiler.timed("pick"):
+            index = self.pick_index(x, y)
+        if index is None or not index.isValid():
+            return
+
+        index = QModelIndex(index)
+        self.hierarchy.setCurrentIndex(index)
+        self.hierarchy.scrollTo(index)  # expands the parents if necessary
+
+        if self.merger is not None:
+            # the selected region is rendered on its own
+            self._update()
+
+    def pick_index(self, x, y):
+        renderer = self.scene.plotter.renderer
+
+        # only regions can be picked, not the root mesh enclosing them
+        pick_list = vtkPropCollection()
+        for actor in self.actor_items:
+            pick_list.AddItem(actor)
+        if self.merger is not None and self.merger.actor is not None:
+            pick_list.AddItem(self.merger.actor)
+
+        if not self.prop_picker.PickProp(x, y, renderer, pick_list):
+            return None
+        actor = self.prop_picker.GetActor()
+
+        if self.merger is not None and actor is self.merger.actor:
+            # Find which region the picked triangle belongs to
+            self.cell_picker.InitializePickList()
+            self.cell_picker.AddPickList(actor)
+            self.cell_picker.RemoveAllLocators()
+            self.cell_picker.AddLocator(self.merger.locator)
+            if not self.cell_picker.Pick(x, y, 0, renderer):
+                return None
+            region = self.merger.region_from_cell(
+                self.cell_picker.GetCellId()
+            )
+            if region is None:
+                return None
+            return QPersistentModelIndex(self.tree_items[region].index())
+
+        return self.actor_items.get(actor)
+
     # ---------------------------------- Update ---------------------------------- #
     def show_hide_mesh(self, val):
         """
@@ -125,14 +261,15 @@ class MainWindow(Scene, Window):
                 fnt.setBold(True)
                 item.setFont(fnt)
 
-                if not self.random_colors:
-                    self.scene.add_brain_regions(region)
-                else:
-                    self.scene.add_brain_regions(
-                        region,
-                        use_original_color=False,
-                        colors=brainrender.colors.get_random_colors(1),
-                    )
+                with self.profiler.timed("add_brain_regions"):
+                    if not self.random_colors:
+                        self.scene.add_brain_regions(region)
+                    else:
+                        self.scene.add_brain_regions(
+                            region,
+                            use_original_color=False,
+                            colors=brainrender.colors.get_random_colors(1),
+                        )
             else:
                 del self.scene.actors["regions"][region]
 
@@ -147,21 +284,197 @@ class MainWindow(Scene, Window):
             Updates the scene's Plotter to add/remove
             meshes
         """
-        self.scene.apply_render_style()
+        with self.profiler.timed("_update"):
+            self._update_actor_items()
 
-        self.scene.plotter.show(
-            *self.scene.get_actors(),
-            interactorStyle=0,
-            bg=brainrender.BACKGROUND_COLOR,
-        )
+            with self.profiler.timed("apply_render_style"):
+                self.scene.apply_render_style()
+
+            self._render()
+
+    def _render(self):
+        """
+            Renders the scene's actors, e.g. to swap in the merged
+            regions actor once it's ready (without restyling the scene)
+        """
+        with self.profiler.timed("show"):
+            self.scene.plotter.show(
+                *self.get_render_actors(),
+                interactorStyle=0,
+                bg=brainrender.BACKGROUND_COLOR,
+            )
+        self.profiler.add_overlay(self.scene.plotter.renderer)
 
         # Fake a button press to force update
         self.scene.plotter.interactor.MiddleButtonPressEvent()
         self.scene.plotter.interactor.MiddleButtonReleaseEvent()
 
+    def selected_region(self):
+        """
+            Returns the name of the region currently selected in the tree
+        """
+        idxs = self.hierarchy.selectedIndexes()
+        if not idxs:
+            return None
+        return idxs[0].model().itemFromIndex(idxs[0]).tag
+
+    def get_render_actors(self):
+        """
+            Returns the actors to be rendered. When merging regions,
+            the individual meshes of the static regions are replaced by
+            the merged actor. While it's rebuilt in the background, the
+            previous merged actor is used for the regions that haven't
+            changed and only the changed ones are rendered individually.
+        """
+        actors = self.scene.get_actors()
+        if self.merger is None:
+            return actors
+
+        selected = self.selected_region()
+        static = {
+            region: actor
+            for region, actor in self.scene.actors["regions"].items()
+            if region != selected
+        }
+        self.merger.update(static)
+        rendered = self.merger.rendered_regions()
+        if not rendered:
+            return actors
+
+        merged = set(id(static[region]) for region in rendered)
+        actors = [actor for actor in actors if id(actor) not in merged]
+        actors.append(self.merger.actor)
+        return actors
+
+    # ---------------------------------- Session --------------------------------- #
+    def get_session_state(self):
+        """
+            Returns a dictionary with the visible regions and
+            their colors, the camera and the tree's expanded items
+        """
+        regions = {
+            region: [float(c) for c in actor.color()]
+            for region, actor in self.scene.actors["regions"].items()
+        }
+        expanded = [
+            tag
+            for tag, item in self.tree_items.items()
+            if self.hierarchy.isExpanded(item.index())
+        ]
+        return dict(
+            atlas=self.scene.atlas.atlas_name,
+            root=self.scene.root is not None,
+            regions=regions,
+            camera=get_camera_params(
+                self.scene.plotter.renderer.GetActiveCamera()
+            ),
+            expanded=expanded,
+        )
+
+    def save_session(self, path):
+        save_session(path, self.get_session_state())
+
+    def restore_session(self, session):
+        """
+            Restores a saved session, replacing the regions currently
+            shown: all new regions are loaded in a single call to
+            add_brain_regions and the scene is rendered only once.
+            Raises a ValueError if the session was saved with another atlas.
+
+            Arguments
+            ---------
+            session: path to a session file or session state dictionary
+        """
+        state = load_session(session)
+        if state["atlas"] != self.scene.atlas.atlas_name:
+            raise ValueError(
+                f"The session was saved with atlas {state['atlas']}, "
+                + f"but the viewer is showing {self.scene.atlas.atlas_name}"
+            )
+
+        # Remove regions that are not in the session
+        for region in list(self.scene.actors["regions"].keys()):
+            if region not in state["regions"]:
+                del self.scene.actors["regions"][region]
+                if region in self.tree_items:
+                    item = self.tree_items[region]
+                    item.setCheckState(Qt.Unchecked)
+                    item._checked = False
+                    item.toggle_active()
+
+        # Recolor the regions that are kept
+        for region, actor in self.scene.actors["regions"].items():
+            actor.color(state["regions"][region])
+
+        # Add all new regions at once
+        regions = {
+            region: color
+            for region, color in state["regions"].items()
+            if region in self.tree_items
+            and region not in self.scene.actors["regions"].keys()
+        }
+        if regions:
+            with self.profiler.timed("add_brain_regions"):
+                self.scene.add_brain_regions(
+                    list(regions.keys()),
+                    use_original_color=False,
+                    colors=list(regions.values()),
+                )
+
+        if state.get("root", False):
+            if self.scene.root is None:
+                self.scene.add_root()
+        elif self.scene.root is not None:
+            self.scene.root = None
+            self.scene.actors["root"] = None
+
+        # Update hierarchy's items, only for the regions actually
+        # loaded (e.g. regions without a mesh are skipped)
+        for region in regions:
+            if region not in self.scene.actors["regions"]:
+                continue
+            item = self.tree_items[region]
+            item.setCheckState(Qt.Checked)
+            item._checked = True
+            item.toggle_active()
+
+        expanded = set(state.get("expanded", []))
+        for tag, item in self.tree_items.items():
+            if item.hasChildren():
+                self.hierarchy.setExpanded(item.index(), tag in expanded)
+
+        set_camera(self.scene, state["camera"])
+        self._update()
+
+    def save_session_dialog(self):
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Save session", filter="Session (*.json)", options=options
+        )
+        if path:
+            self.save_session(path)
+
+    def load_session_dialog(self):
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Load session", filter="Session (*.json)", options=options
+        )
+        if path:
+            try:
+                self.restore_session(path)
+            except ValueError as e:
+                QMessageBox.warning(self, "Could not load session", str(e))
+
     # ----------------------------------- Close ---------------------------------- #
     def keyPressEvent(self, event):
-        if (
+        if event.modifiers() & QtCore.Qt.ControlModifier:
+            if event.key() == QtCore.Qt.Key_S:
+                self.save_session_dialog()
+            elif event.key() == QtCore.Qt.Key_O:
+                self.load_session_dialog()
+        elif (
             event.key() == QtCore.Qt.Key_Escape
             or event.key() == QtCore.Qt.Key_Q
         ):
@@ -171,4 +484,7 @@ class MainWindow(Scene, Window):
         """
             Disable the interactor before closing to prevent it from trying to act on a already deleted items
         """
+        self.profiler.export()
+        if self.merger is not None:
+            self.merger.shutdown()
         self.vtkWidget.close()
@@ -0,0 +1,235 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+from vedo import Mesh
+from vtk import (
+    vtkAppendPolyData,
+    vtkCellLocator,
+    vtkDataSetAttributes,
+    vtkPolyData,
+)
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+
+"""
+    Merges the meshes of many brain regions into a single actor
+    with per-vertex colors, to reduce the number of draw calls when
+    hundreds of regions are visible. The merged mesh keeps track of
+    which region each triangle comes from so that it can still be picked.
+    While the merged mesh is rebuilt, the previous one keeps being rendered
+    with the triangles of outdated regions hidden.
+"""
+
+REGION_ID_ARRAY = "region_id"
+
+
+class RegionMerger(QObject):
+    # emitted (in the gui thread) when a new merged actor is ready
+    ready = pyqtSignal()
+
+    # used internally to hand the merged polydata back to the gui thread
+    _merged = pyqtSignal(object)
+
+    def __init__(self):
+        """
+            Builds the merged actor in a background thread. Each region's
+            colored copy is cached, so when the set of regions changes
+            only the new regions need to be processed.
+        """
+        super().__init__()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._merged.connect(self._on_merged)
+
+        self._parts = {}  # region -> (key, colored polydata)
+        self._ids = {}  # region -> id stored in the merged cell data
+        self._names = {}  # id stored in the merged cell data -> region
+
+        self._requested = None  # key of the latest set of regions
+        self._built = None  # key of the set of regions in self.actor
+        self._part_keys = {}  # region -> key of the latest requested part
+        self._built_parts = {}  # region -> key of the part in self.actor
+        self._cell_ranges = {}  # region -> range of its cells in self.actor
+        self.actor = None
+        self.locator = None  # cell locator of the merged polydata
+        self.source_property = None
+
+    @property
+    def is_current(self):
+        """
+            True if the merged actor matches the latest set of regions
+        """
+        return self.actor is not None and self._built == self._requested
+
+    def update(self, actors):
+        """
+            Starts merging a new set of region meshes, if it
+            has changed since the last call.
+
+            Arguments
+            ---------
+            actors: dictionary of region name -> vedo Mesh
+        """
+        parts = {
+            region: (
+                actor.polydata(True),
+                tuple(actor.color()),
+                actor.alpha(),
+                id(actor),
+            )
+            for region, actor in actors.items()
+        }
+        self._part_keys = {
+            region: (color, alpha, actor_id)
+            for region, (_, color, alpha, actor_id) in parts.items()
+        }
+        key = frozenset(self._part_keys.items())
+        if key == self._requested:
+            return
+
+        self._requested = key
+        for region in parts:
+            if region not in self._ids:
+                self._ids[region] = len(self._ids)
+                self._names[self._ids[region]] = region
+
+        if actors:
+            self.source_property = next(iter(actors.values())).GetProperty()
+        self._executor.submit(self._merge, parts, key)
+
+    def _colored_part(self, region, polydata, color):
+        """
+            Returns a copy of a region's polydata with per-vertex
+            colors and the region's id for each triangle
+        """
+        part = vtkPolyData()
+        part.DeepCopy(polydata)
+
+        rgb = np.tile(
+            (np.array(color) * 255).astype(np.uint8),
+            (part.GetNumberOfPoints(), 1),
+        )
+        colors = numpy_to_vtk(rgb, deep=True)
+        colors.SetName("RGB")
+        part.GetPointData().SetScalars(colors)
+
+        region_id = numpy_to_vtk(
+            np.full(part.GetNumberOfCells(), self._ids[region], np.int32),
+            deep=True,
+        )
+        region_id.SetName(REGION_ID_ARRAY)
+        part.GetCellData().AddArray(region_id)
+        return part
+
+    def _merge(self, parts, key):
+        """
+            Runs in the background thread
+        """
+        for region in list(self._parts.keys()):
+            if region not in parts:
+                del self._parts[region]
+
+        append = vtkAppendPolyData()
+        built_parts, cell_ranges, n_cells = {}, {}, 0
+        for region, (polydata, color, alpha, actor_id) in parts.items():
+            part_key = (color, alpha, actor_id)
+            if (
+                region not in self._parts
+                or self._parts[region][0] != part_key
+            ):
+                self._parts[region] = (
+                    part_key,
+                    self._colored_part(region, polydata, color),
+                )
+            part = self._parts[region][1]
+            append.AddInputData(part)
+
+            built_parts[region] = part_key
+            cell_ranges[region] = (n_cells, n_cells + part.GetNumberOfCells())
+            n_cells += part.GetNumberOfCells()
+
+        if parts:
+            append.Update()
+            merged = append.GetOutput()
+
+            # used to hide the cells of outdated regions
+            ghosts = numpy_to_vtk(np.zeros(n_cells, np.uint8), deep=True)
+            ghosts.SetName(vtkDataSetAttributes.GhostArrayName())
+            merged.GetCellData().AddArray(ghosts)
+
+            # used to pick triangles of the merged mesh
+            locator = vtkCellLocator()
+            locator.SetDataSet(merged)
+            locator.BuildLocator()
+        else:
+            merged, locator = None, None
+        self._merged.emit((key, merged, locator, built_parts, cell_ranges))
+
+    def _on_merged(self, result):
+        """
+            Runs in the gui thread: creates the merged actor
+        """
+        key, merged, locator, built_parts, cell_ranges = result
+        if key != self._requested:
+            return  # a newer set of regions is being merged
+
+        self.locator = locator
+        self._built_parts = built_parts
+        self._cell_ranges = cell_ranges
+        if merged is None:
+            self.actor = None
+        else:
+            self.actor = Mesh(merged)
+            if self.source_property is not None:
+                self.actor.GetProperty().DeepCopy(self.source_property)
+
+            mapper = self.actor.GetMapper()
+            mapper.ScalarVisibilityOn()
+            mapper.SetScalarModeToUsePointData()
+            mapper.SetColorModeToDirectScalars()
+        self._built = key
+        self.ready.emit()
+
+    def rendered_regions(self):
+        """
+            Returns the regions drawn by the merged actor: the ones whose
+            mesh is up to date in it. While a new merged actor is being
+            built, the cells of outdated regions are hidden so that the
+            previous one can still be rendered, and only the changed
+            regions need to be rendered as individual actors.
+        """
+        if self.actor is None:
+            return set()
+
+        rendered = set(
+            region
+            for region, part_key in self._built_parts.items()
+            if self._part_keys.get(region) == part_key
+        )
+
+        cell_data = self.actor.polydata(False).GetCellData()
+        ghosts = cell_data.GetArray(vtkDataSetAttributes.GhostArrayName())
+        ghosts_view = vtk_to_numpy(ghosts)
+        for region, (start, stop) in self._cell_ranges.items():
+            hidden = region not in rendered
+            if bool(ghosts_view[start]) != hidden:
+                ghosts_view[start:stop] = (
+                    vtkDataSetAttributes.HIDDENCELL if hidden else 0
+                )
+                ghosts.Modified()
+        return rendered
+
+    def region_from_cell(self, cell_id):
+        """
+            Returns the name of the region a triangle of
+            the merged actor belongs to (None for hidden triangles)
+        """
+        cell_data = self.actor.polydata(False).GetCellData()
+        ghosts = cell_data.GetArray(vtkDataSetAttributes.GhostArrayName())
+        if ghosts.GetValue(cell_id):
+            return None
+        region_id = cell_data.GetArray(REGION_ID_ARRAY).GetValue(cell_id)
+        return self._names[region_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,171 @@
+import json
+import time
+from contextlib import contextmanager
+
+from vtk import vtkTextActor
+
+
+"""
+    Opt-in performance instrumentation for the 3d viewer: times every
+    frame rendered by the vtk render window together with the number of
+    actors and triangles drawn, and the time spent in named code sections.
+    Everything is recorded as a chrome trace (chrome://tracing, perfetto).
+"""
+
+
+def count_geometry(render_window):
+    """
+        Returns the number of visible actors and triangles
+        (polygons) across all renderers of a vtk render window
+    """
+    n_actors, n_triangles = 0, 0
+    renderers = render_window.GetRenderers()
+    renderers.InitTraversal()
+    for _ in range(renderers.GetNumberOfItems()):
+        actors = renderers.GetNextItem().GetActors()
+        actors.InitTraversal()
+        for _ in range(actors.GetNumberOfItems()):
+            actor = actors.GetNextActor()
+            if not actor.GetVisibility() or actor.GetMapper() is None:
+                continue
+            n_actors += 1
+            data = actor.GetMapper().GetInput()
+            if data is not None and hasattr(data, "GetNumberOfPolys"):
+                n_triangles += data.GetNumberOfPolys()
+    return n_actors, n_triangles
+
+
+class FrameProfiler:
+    def __init__(self, enabled=True, trace_path=None, overlay=True):
+        """
+            Records frame times and timed sections of code.
+
+            Arguments
+            ---------
+            enabled: if False nothing is recorded
+            trace_path: path where the trace is saved by export()
+            overlay: if True a text overlay with the last frame's
+                statistics is shown in the render window
+        """
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.events = []
+        self.frame_times = []  # in ms
+        self._t0 = time.perf_counter()
+        self._frame_start = None
+
+        self.overlay = None
+        if enabled and overlay:
+            self.overlay = vtkTextActor()
+            self.overlay.GetTextProperty().SetFontSize(14)
+            self.overlay.SetPosition(10, 10)
+
+    def _now(self):
+        """ time since creation, in microseconds """
+        return (time.perf_counter() - self._t0) * 1e6
+
+    def _add_event(self, name, start, end=None, args=None):
+        if end is None:
+            end = self._now()
+        self.events.append(
+            dict(
+                name=name,
+                ph="X",
+                ts=start,
+                dur=end - start,
+                pid=0,
+                tid=0,
+                args=args or {},
+            )
+        )
+
+    # ----------------------------------- vtk ------------------------------------ #
+    def attach(self, render_window):
+        """
+            Starts timing every frame rendered by render_window
+        """
+        if not self.enabled:
+            return
+        render_window.AddObserver("StartEvent", self._on_frame_start)
+        render_window.AddObserver("EndEvent", self._on_frame_end)
+
+    def add_overlay(self, renderer):
+        """
+            Adds the statistics overlay to a renderer. It's safe to call
+            this every time the plotter's actors are reset.
+        """
+        if self.overlay is not None:
+            renderer.AddActor2D(self.overlay)
+
+    def _on_frame_start(self, render_window, event):
+        self._frame_start = self._now()
+
+    def _on_frame_end(self, render_window, event):
+        if self._frame_start is None:
+            return
+
+        # counting actors isn't part of the frame
+        end = self._now()
+        n_actors, n_triangles = count_geometry(render_window)
+        self._add_event(
+            "frame",
+            self._frame_start,
+            end=end,
+            args=dict(actors=n_actors, triangles=n_triangles),
+        )
+        self._frame_start = None
+
+        frame_time = self.events[-1]["dur"] / 1000
+        self.frame_times.append(frame_time)
+        if self.overlay is not None:
+            self.overlay.SetInput(
+                f"frame: {frame_time:.1f} ms | actors: {n_actors} | "
+                + f"triangles: {n_triangles:,}"
+            )
+
+    # ---------------------------------- timing ---------------------------------- #
+    @contextmanager
+    def timed(self, name):
+        """
+            Context manager recording the time spent
+            in a section of code under the given name
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start = self._now()
+        try:
+            yield
+        finally:
+            self._add_event(name, start)
+
+    def summary(self):
+        """
+            Returns a dictionary with the mean and max frame times
+            and the total time spent in each timed section (in ms)
+        """
+        summary = dict(n_frames=len(self.frame_times))
+        if self.frame_times:
+            summary["mean_frame_time"] = sum(self.frame_times) / len(
+                self.frame_times
+            )
+            summary["max_frame_time"] = max(self.frame_times)
+        for event in self.events:
+            if event["name"] != "frame":
+                summary[event["name"]] = (
+                    summary.get(event["name"], 0) + event["dur"] / 1000
+                )
+        return summary
+
+    def export(self, trace_path=None):
+        """
+            Saves the recorded events as a chrome trace file
+        """
+        trace_path = trace_path or self.trace_path
+        if not self.enabled or trace_path is None:
+            return
+        with open(trace_path, "w") as f:
+            json.dump(
+                dict(traceEvents=self.events, displayTimeUnit="ms"), f
+            )
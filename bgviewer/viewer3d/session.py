@@ -0,0 +1,105 @@
+import json
+
+from brainrender.scene import Scene
+
+
+"""
+    Saving and loading the state of a 3d viewer session: which
+    brain regions are visible and with which colors, the camera and
+    which items of the hierarchy tree are expanded.
+    Sessions are stored as json files and can be restored in the gui
+    or used to build a brainrender Scene without a gui.
+"""
+
+CAMERA_KEYS = ["position", "focal", "viewup", "distance", "clipping"]
+
+
+def get_camera_params(camera):
+    """
+        Returns the parameters of a vtkCamera in the
+        format used by brainrender's set_camera
+    """
+    return dict(
+        position=list(camera.GetPosition()),
+        focal=list(camera.GetFocalPoint()),
+        viewup=list(camera.GetViewUp()),
+        distance=camera.GetDistance(),
+        clipping=list(camera.GetClippingRange()),
+    )
+
+
+def save_session(path, state):
+    with open(path, "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def load_session(session):
+    """
+        Returns a session's state given the path to a
+        session file (or the state itself)
+    """
+    if isinstance(session, dict):
+        return session
+
+    with open(session) as f:
+        state = json.load(f)
+
+    missing = {"atlas", "regions", "camera"} - set(state.keys())
+    if missing:
+        raise ValueError(
+            f"Invalid session file {session}, missing: {sorted(missing)}"
+        )
+
+    missing = set(CAMERA_KEYS) - set(state["camera"].keys())
+    if missing:
+        raise ValueError(
+            f"Invalid camera in session file {session}, "
+            + f"missing: {sorted(missing)}"
+        )
+    return state
+
+
+def scene_from_session(session, **kwargs):
+    """
+        Creates a brainrender Scene showing the regions saved in a
+        session, with the session's camera. Useful to render a session
+        (e.g. to take screenshots) without the gui.
+
+        Arguments
+        ---------
+        session: path to a session file or session state dictionary
+        kwargs: passed to brainrender's Scene
+    """
+    state = load_session(session)
+    scene = Scene(
+        atlas=state["atlas"],
+        add_root=state.get("root", True),
+        camera=state["camera"],
+        **kwargs,
+    )
+
+    if state["regions"]:
+        scene.add_brain_regions(
+            list(state["regions"].keys()),
+            use_original_color=False,
+            colors=list(state["regions"].values()),
+        )
+    return scene
+
+
+def render_session(session, screenshot_path, **kwargs):
+    """
+        Renders a session offscreen, without the gui,
+        and saves a screenshot of it
+
+        Arguments
+        ---------
+        session: path to a session file or session state dictionary
+        screenshot_path: path of the image file to save
+        kwargs: passed to brainrender's Scene
+    """
+    scene = scene_from_session(session, **kwargs)
+    scene.plotter.offscreen = True
+    scene.render(interactive=False)
+    scene.plotter.screenshot(str(screenshot_path))
+    scene.close()
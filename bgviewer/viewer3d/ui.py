@@ -247,6 +247,7 @@ class Window(QMainWindow):
         # Add element's hierarchy
         tree = self.scene.atlas.hierarchy
         items = {}
+        self.tree_items = {}  # region acronym -> StandardItem
         for n, node in enumerate(tree.expand_tree()):
             # Get Node info
             node = tree.get_node(node)
@@ -274,6 +275,7 @@ class Window(QMainWindow):
 
             # Keep track of added nodes
             items[node.identifier] = item
+            self.tree_items[node.tag] = item
             if n == 0:
                 root = item
 
@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+
+from bgviewer.atlas_pool import AtlasSession, ContentCache, MemoryBudget
+
+
+class FakeVolume:
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+def write_atlas(directory, structures):
+    directory.mkdir()
+    with open(directory / "structures.json", "w") as f:
+        json.dump(structures, f)
+    return directory
+
+
+def test_content_digest(tmp_path):
+    first = tmp_path / "first.bin"
+    second = tmp_path / "second.bin"
+    first.write_bytes(bytes(range(256)) * 64)
+    second.write_bytes(bytes(range(256)) * 64)
+
+    cache = ContentCache()
+    assert cache.digest(first) == cache.digest(second)
+
+    # files differing only in the middle have different digests
+    second.write_bytes(
+        bytes(range(256)) * 31 + bytes(256) + bytes(range(256)) * 32
+    )
+    assert cache.digest(first) != cache.digest(second)
+
+
+def test_shared_structures(tmp_path):
+    structures = [{"id": 1, "name": "root"}]
+    atlas_10um = write_atlas(tmp_path / "atlas_10um", structures)
+    atlas_25um = write_atlas(tmp_path / "atlas_25um", structures)
+    other = write_atlas(tmp_path / "other", [{"id": 2, "name": "grey"}])
+
+    session = AtlasSession()
+    for atlas in (atlas_10um, atlas_25um, other):
+        session.add_atlas(atlas)
+
+    first = session.load_structures(atlas_10um / "structures.json")
+    second = session.load_structures(atlas_25um / "structures.json")
+    third = session.load_structures(other / "structures.json")
+
+    assert first is second
+    assert third is not first
+    assert len(session.cache) == 2
+    assert list(session.atlases) == ["atlas_10um", "atlas_25um", "other"]
+
+
+def test_memory_budget_evicts_least_recently_viewed():
+    evicted = []
+    budget = MemoryBudget(
+        100, on_evict=lambda key, obj: evicted.append(key)
+    )
+    budget.add("a", FakeVolume(40), 40)
+    budget.add("b", FakeVolume(40), 40)
+    budget.get("a")
+    budget.add("c", FakeVolume(40), 40)
+
+    assert evicted == ["b"]
+    assert "a" in budget and "c" in budget
+    assert budget.used_bytes == 80
+
+
+def test_session_evicts_volume_views(tmp_path):
+    for name in ("reference.tiff", "annotation.tiff"):
+        (tmp_path / name).write_bytes(name.encode())
+
+    evicted = []
+    session = AtlasSession(memory_budget=150, on_evict=evicted.append)
+    session.load_volume(
+        tmp_path / "reference.tiff",
+        lambda p: np.zeros(100, np.uint8),
+        "reference",
+    )
+    session.load_volume(
+        tmp_path / "annotation.tiff",
+        lambda p: np.zeros(100, np.uint8),
+        "annotation",
+    )
+
+    assert evicted == [{"reference"}]
+
+
+def test_lazy_volumes_not_charged(tmp_path):
+    (tmp_path / "reference.tiff").write_bytes(b"reference")
+
+    session = AtlasSession(memory_budget=150)
+    session.load_volume(
+        tmp_path / "reference.tiff", lambda p: FakeVolume(1000), "reference"
+    )
+    assert session.volumes.used_bytes == 0
@@ -0,0 +1,94 @@
+import numpy as np
+import tifffile
+
+from bgviewer.channels import (
+    ChunkCache,
+    channel_names,
+    estimate_contrast_limits,
+    find_channels,
+    load_channels,
+    multiscale_levels,
+)
+
+
+def write_channels(directory, n_channels=3, shape=(10, 40, 30)):
+    volumes = {}
+    for n in range(n_channels):
+        volume = np.random.randint(0, 1000, size=shape).astype(np.uint16)
+        tifffile.imwrite(str(directory / f"channel_{n}.tiff"), volume)
+        volumes[f"channel_{n}"] = volume
+    (directory / "notes.txt").write_text("not a channel")
+    return volumes
+
+
+def test_load_channels(tmp_path):
+    volumes = write_channels(tmp_path)
+    cache = ChunkCache()
+    paths = find_channels(tmp_path)
+    assert len(paths) == 3
+
+    channels = load_channels(paths, cache, n_samples=4)
+    # only the sampled planes have been read
+    assert len(cache) == 3 * 4
+
+    for channel in channels:
+        volume = volumes[channel.name]
+        np.testing.assert_array_equal(
+            np.asarray(channel.levels[0][5]), volume[5]
+        )
+        low, high = channel.contrast_limits
+        assert volume.min() <= low < high <= volume.max()
+
+
+def test_chunk_cache_budget(tmp_path):
+    write_channels(tmp_path, n_channels=2)
+    plane_bytes = 40 * 30 * 2
+    cache = ChunkCache(max_bytes=5 * plane_bytes)
+
+    channels = load_channels(find_channels(tmp_path), cache, n_samples=4)
+    for channel in channels:
+        np.asarray(channel.levels[0])
+    assert cache.used_bytes <= 5 * plane_bytes
+
+
+def test_multiscale_levels(tmp_path):
+    volume = np.random.randint(0, 255, (2, 2048, 1500)).astype(np.uint8)
+    tifffile.imwrite(str(tmp_path / "channel.tiff"), volume)
+    cache = ChunkCache()
+
+    levels = multiscale_levels(tmp_path / "channel.tiff", cache, min_size=512)
+    assert [level.shape for level in levels] == [
+        (2, 2048, 1500),
+        (2, 1024, 750),
+        (2, 512, 375),
+    ]
+    assert levels[2].chunks == ((1, 1), (512,), (375,))
+
+    # only the downsampled plane is read into the cache
+    np.testing.assert_array_equal(
+        np.asarray(levels[2][1]), volume[1, ::4, ::4]
+    )
+    assert len(cache) == 1
+    assert cache.used_bytes == 512 * 375
+
+
+def test_channel_names(tmp_path):
+    paths = [
+        tmp_path / "brain.c1.tif",
+        tmp_path / "brain.c2.tif",
+        tmp_path / "sample.tif",
+        tmp_path / "sample.tiff",
+    ]
+    assert channel_names(paths) == [
+        "brain.c1",
+        "brain.c2",
+        "sample.tif",
+        "sample.tiff",
+    ]
+
+
+def test_estimate_contrast_limits():
+    volume = np.zeros((20, 5, 5))
+    volume[::2] = 100
+    assert estimate_contrast_limits(volume, n_samples=3) == [0.0, 100.0]
+    assert estimate_contrast_limits(np.ones((4, 3, 3))) == [1.0, 2.0]
@@ -0,0 +1,62 @@
+import numpy as np
+
+from bgviewer.outlines import OutlineVolume, slice_boundaries
+
+
+def test_slice_boundaries():
+    labels = np.zeros((5, 6), dtype=np.uint16)
+    labels[1:4, 1:3] = 1
+    labels[1:4, 3:5] = 2
+
+    outlines = slice_boundaries(labels)
+    # boundary pixels keep their label, region interiors are cleared
+    assert outlines[1, 1] == 1
+    assert outlines[2, 2] == 1
+    assert outlines[2, 3] == 2
+    assert outlines[2, 4] == 2
+    assert outlines[0, 0] == 0
+    assert not np.any(outlines[labels == 0])
+
+    # a uniform slice has no boundaries
+    assert not np.any(slice_boundaries(np.ones((4, 4))))
+
+
+def test_outline_volume():
+    labels = np.random.randint(0, 3, size=(6, 8, 7))
+    outlines = OutlineVolume(labels, max_slices=4, prefetch=1)
+
+    assert outlines.shape == labels.shape
+    np.testing.assert_array_equal(outlines[2], slice_boundaries(labels[2]))
+    np.testing.assert_array_equal(
+        outlines[-1, 2:5], slice_boundaries(labels[-1])[2:5]
+    )
+    assert len(outlines._cache) <= 4
+
+
+def test_outline_volume_rolled_dims():
+    labels = np.random.randint(0, 3, size=(6, 8, 7))
+    outlines = OutlineVolume(labels, max_slices=4, prefetch=0)
+
+    # outlines are computed over the displayed axes, whichever they are
+    np.testing.assert_array_equal(
+        outlines[:, 3, :], slice_boundaries(labels[:, 3, :])
+    )
+    np.testing.assert_array_equal(
+        outlines[:, :, 5], slice_boundaries(labels[:, :, 5])
+    )
+    assert list(outlines._cache.keys()) == [((1,), (3,)), ((2,), (5,))]
+
+    # the 3d view is never computed
+    assert not np.any(outlines[1:3])
+    assert outlines[1:3].shape == (2, 8, 7)
+    assert len(outlines._cache) == 2
+
+
+def test_outline_volume_label_at():
+    labels = np.random.randint(1, 3, size=(6, 8, 7))
+    outlines = OutlineVolume(labels)
+
+    # the label is returned inside regions too, not only on outlines
+    assert outlines.label_at((2.2, 3.9, 5)) == labels[2, 4, 5]
+    assert outlines.label_at((6, 0, 0)) is None
+    assert outlines.label_at((0, -1, 0)) is None
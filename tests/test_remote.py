@@ -0,0 +1,141 @@
+import json
+import threading
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+import numpy as np
+import pytest
+import tifffile
+
+from bgviewer.atlas_pool import AtlasSession, ContentCache
+from bgviewer.channels import ChunkCache
+from bgviewer.remote import RemotePath, RemoteStore, is_remote, lazy_tiff
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+        Serves files with support for single range requests,
+        as a local stand-in for a remote object store
+    """
+
+    def send_head(self):
+        if "Range" not in self.headers:
+            return super().send_head()
+
+        path = self.translate_path(self.path)
+        f = open(path, "rb")
+        data = f.read()
+        f.close()
+        start, end = self.headers["Range"].replace("bytes=", "").split("-")
+        start, end = int(start), min(int(end), len(data) - 1)
+
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(data[start : end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def atlas_server(tmp_path, monkeypatch):
+    atlas_directory = tmp_path / "server" / "example_atlas_25um"
+    atlas_directory.mkdir(parents=True)
+    with open(atlas_directory / "structures.json", "w") as f:
+        json.dump([{"id": 1, "name": "root"}], f)
+    with open(atlas_directory / "metadata.json", "w") as f:
+        json.dump({"name": "example_atlas", "resolution": [25, 25, 25]}, f)
+    (atlas_directory / "volume.bin").write_bytes(bytes(range(256)) * 100)
+
+    monkeypatch.chdir(tmp_path / "server")
+    server = HTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", atlas_directory
+    server.shutdown()
+
+
+def test_is_remote(tmp_path):
+    assert is_remote("https://example.com/atlas")
+    assert not is_remote(tmp_path)
+
+
+def test_remote_read(atlas_server, tmp_path):
+    url, atlas_directory = atlas_server
+    store = RemoteStore(cache_dir=tmp_path / "cache", block_size=1000)
+    atlas = RemotePath(f"{url}/example_atlas_25um/", store=store)
+    assert atlas.name == "example_atlas_25um"
+
+    volume = atlas / "volume.bin"
+    expected = (atlas_directory / "volume.bin").read_bytes()
+    assert volume.stat().st_size == len(expected)
+
+    # reads spanning several blocks
+    with volume.open("rb") as f:
+        f.seek(1500)
+        assert f.read(2700) == expected[1500:4200]
+        f.seek(-10, 2)
+        assert f.read() == expected[-10:]
+    assert volume.read_bytes() == expected
+
+    # blocks are cached on disk
+    assert len(list((tmp_path / "cache").glob("*/*"))) == 26
+
+    # cached blocks aren't reused once the file is replaced
+    (atlas_directory / "volume.bin").write_bytes(bytes(range(100)) * 50)
+    store = RemoteStore(cache_dir=tmp_path / "cache", block_size=1000)
+    volume = RemotePath(volume.url, store=store)
+    assert volume.read_bytes() == bytes(range(100)) * 50
+
+
+def test_remote_atlas_session(atlas_server, tmp_path):
+    url, atlas_directory = atlas_server
+    store = RemoteStore(cache_dir=tmp_path / "cache")
+    atlas = RemotePath(f"{url}/example_atlas_25um", store=store)
+
+    # remote files are identified without downloading them
+    digest = ContentCache().digest(atlas / "volume.bin")
+    assert digest.startswith(f"{url}/example_atlas_25um/volume.bin@")
+    assert not (tmp_path / "cache").exists()
+
+    session = AtlasSession()
+    session.add_atlas(atlas)
+    metadata = session.load_metadata(atlas / "metadata.json")
+    assert metadata["name"] == "example_atlas"
+    structures = session.load_structures(atlas / "structures.json")
+    assert structures is session.load_structures(atlas / "structures.json")
+    assert len(list((tmp_path / "cache").glob("*/*"))) == 2
+
+
+def test_lazy_tiff(atlas_server, tmp_path):
+    url, atlas_directory = atlas_server
+    expected = np.arange(4 * 50 * 40, dtype=np.uint16).reshape(4, 50, 40)
+    tifffile.imwrite(str(atlas_directory / "annotation.tiff"), expected)
+    store = RemoteStore(cache_dir=tmp_path / "cache", block_size=1000)
+    atlas = RemotePath(f"{url}/example_atlas_25um", store=store)
+
+    chunk_cache = ChunkCache(max_bytes=1024 ** 2)
+    volume = lazy_tiff(atlas / "annotation.tiff", chunk_cache)
+    assert volume.shape == expected.shape
+    assert volume.chunks[0] == (1, 1, 1, 1)
+    cached_blocks = set((tmp_path / "cache").glob("*/*"))
+
+    np.testing.assert_array_equal(volume[2].compute(), expected[2])
+    assert len(chunk_cache) == 1
+
+    # only the blocks of the plane read were fetched
+    with tifffile.TiffFile(str(atlas_directory / "annotation.tiff")) as tif:
+        offset = tif.series[0].dataoffset
+    plane_bytes = expected[0].nbytes
+    start = offset + 2 * plane_bytes
+    plane_blocks = set(
+        range(start // 1000, (start + plane_bytes - 1) // 1000 + 1)
+    )
+    blocks = {
+        int(path.name.split("_")[1])
+        for path in (tmp_path / "cache").glob("*/*")
+    }
+    assert blocks == plane_blocks | {
+        int(path.name.split("_")[1]) for path in cached_blocks
+    }
@@ -0,0 +1,63 @@
+import json
+import sys
+
+import pytest
+
+from bgviewer.viewer3d import main
+from bgviewer.viewer3d.session import (
+    load_session,
+    render_session,
+    scene_from_session,
+)
+
+CAMERA = dict(
+    position=[-16170, -7127, 31776],
+    focal=[7650, 4000, 5700],
+    viewup=[0, -1, 0],
+    distance=37000,
+    clipping=[23000, 54000],
+)
+
+
+def write_session(path, **kwargs):
+    state = dict(
+        atlas="allen_mouse_25um_v0.2",
+        root=True,
+        regions={"CA1": [1.0, 0.0, 0.0], "MOs": [0.0, 0.0, 1.0]},
+        camera=CAMERA,
+        expanded=[],
+    )
+    state.update(kwargs)
+    with open(path, "w") as f:
+        json.dump(state, f)
+    return path
+
+
+def test_load_session_invalid(tmp_path):
+    with open(tmp_path / "session.json", "w") as f:
+        json.dump(dict(atlas="allen_mouse_25um_v0.2", regions={}), f)
+    with pytest.raises(ValueError):
+        load_session(tmp_path / "session.json")
+
+    path = write_session(tmp_path / "session.json", camera=dict(focal=[0]))
+    with pytest.raises(ValueError):
+        load_session(path)
+
+
+def test_scene_from_session(tmp_path):
+    scene = scene_from_session(write_session(tmp_path / "session.json"))
+    assert set(scene.actors["regions"].keys()) == {"CA1", "MOs"}
+
+
+def test_render_session(tmp_path):
+    screenshot_path = tmp_path / "session.png"
+    render_session(write_session(tmp_path / "session.json"), screenshot_path)
+    assert screenshot_path.exists()
+
+
+def test_main_atlas_mismatch(tmp_path, monkeypatch):
+    path = write_session(tmp_path / "session.json")
+    argv = ["bgviewer3d", "--atlas", "example_mouse_100um"]
+    monkeypatch.setattr(sys, "argv", argv + ["--session", str(path)])
+    with pytest.raises(SystemExit):
+        main()
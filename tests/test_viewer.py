@@ -0,0 +1,32 @@
+import napari
+import numpy as np
+import tifffile
+
+from bgviewer.viewer import ViewerWidget
+
+
+def test_load_volume_memory_budget(qtbot, tmp_path):
+    volumes = []
+    for n in range(3):
+        volume = np.full((4, 20, 25), n, dtype=np.uint16)
+        tifffile.imwrite(str(tmp_path / f"volume_{n}.tiff"), volume)
+        volumes.append(volume)
+
+    viewer = napari.Viewer(show=False)
+    widget = ViewerWidget(viewer, memory_budget=2 * volumes[0].nbytes)
+    qtbot.addWidget(widget)
+
+    volume = widget.load_volume(
+        tmp_path / "volume_0.tiff", False, True, "volume_0"
+    )
+    np.testing.assert_array_equal(volume, volumes[0])
+    assert widget.session.volumes.used_bytes == volumes[0].nbytes
+
+    # volumes are held in memory, so the oldest layer
+    # is closed when the budget is exceeded
+    for n in range(3):
+        widget.load_image(tmp_path / f"volume_{n}.tiff", name=f"volume_{n}")
+    assert [layer.name for layer in viewer.layers] == ["volume_1", "volume_2"]
+    assert widget.session.volumes.used_bytes == 2 * volumes[0].nbytes
+    assert "volume_0" in widget.status_label.text()
+    viewer.close()
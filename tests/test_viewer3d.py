@@ -1,5 +1,9 @@
+import numpy as np
+import pytest
+
 from bgviewer.viewer3d import gui
 from PyQt5 import QtCore
+from PyQt5.QtCore import QModelIndex
 
 
 def test_simple_launch(qtbot):
@@ -44,3 +48,142 @@ def test_add_hide(qtbot):
 
     qtbot.mouseClick(window.hierarchy, QtCore.Qt.LeftButton)
     qtbot.mouseClick(window.hierarchy, QtCore.Qt.LeftButton)
+
+
+def test_profile(qtbot, tmp_path):
+    trace_path = tmp_path / "trace.json"
+    window = gui.MainWindow(profile=str(trace_path))
+    qtbot.addWidget(window)
+    window.show()
+
+    window.onClose()
+    assert trace_path.exists()
+    assert "_update" in window.profiler.summary()
+
+
+def test_session(qtbot, tmp_path):
+    window = gui.MainWindow()
+    qtbot.addWidget(window)
+    window.show()
+
+    state = window.get_session_state()
+    state["regions"] = {"CA1": [1.0, 0.0, 0.0], "MOs": [0.0, 0.0, 1.0]}
+    window.restore_session(state)
+    assert set(window.scene.actors["regions"].keys()) == {"CA1", "MOs"}
+
+    session_path = tmp_path / "session.json"
+    window.save_session(session_path)
+
+    window = gui.MainWindow(session=session_path)
+    qtbot.addWidget(window)
+    window.show()
+    assert set(window.scene.actors["regions"].keys()) == {"CA1", "MOs"}
+    assert window.tree_items["CA1"]._checked
+
+    # restoring replaces the regions currently shown
+    state["regions"] = {"MOs": [0.0, 1.0, 0.0]}
+    state["root"] = False
+    window.restore_session(state)
+    assert set(window.scene.actors["regions"].keys()) == {"MOs"}
+    assert not window.tree_items["CA1"]._checked
+    assert window.scene.root is None
+
+    # items expanded since are collapsed, even if none were expanded
+    root_index = window.tree_items["root"].index()
+    window.hierarchy.setExpanded(root_index, True)
+    state["expanded"] = []
+    window.restore_session(state)
+    assert not window.hierarchy.isExpanded(root_index)
+
+    # regions that couldn't be loaded (e.g. without a mesh) aren't checked
+    window.scene.add_brain_regions = lambda *args, **kwargs: None
+    state["regions"] = {"MOs": [0.0, 1.0, 0.0], "CA1": [1.0, 0.0, 0.0]}
+    window.restore_session(state)
+    assert set(window.scene.actors["regions"].keys()) == {"MOs"}
+    assert not window.tree_items["CA1"]._checked
+
+    state["atlas"] = "another_atlas"
+    with pytest.raises(ValueError):
+        window.restore_session(state)
+
+
+def test_merge_regions(qtbot):
+    window = gui.MainWindow(merge_regions=True)
+    qtbot.addWidget(window)
+    window.show()
+
+    state = window.get_session_state()
+    state["regions"] = {"CA1": [1.0, 0.0, 0.0], "MOs": [0.0, 0.0, 1.0]}
+    window.restore_session(state)
+
+    qtbot.waitUntil(lambda: window.merger.is_current)
+    assert window.merger.actor in window.get_render_actors()
+    assert window.merger.region_from_cell(0) in {"CA1", "MOs"}
+
+    # while rebuilding, unchanged regions stay in the previous merged actor
+    state["regions"] = {"CA1": [1.0, 0.0, 0.0], "MOp": [0.0, 1.0, 0.0]}
+    window.restore_session(state)
+    actors = window.get_render_actors()
+    regions = window.scene.actors["regions"]
+    assert window.merger.rendered_regions() == {"CA1"}
+    assert window.merger.actor in actors
+    assert regions["MOp"] in actors
+    assert regions["CA1"] not in actors
+
+    qtbot.waitUntil(lambda: window.merger.is_current)
+    assert window.merger.rendered_regions() == {"CA1", "MOp"}
+
+
+def test_pick(qtbot):
+    window = gui.MainWindow()
+    qtbot.addWidget(window)
+    window.show()
+
+    state = window.get_session_state()
+    state["regions"] = {"CA1": [1.0, 0.0, 0.0]}
+    window.restore_session(state)
+
+    actor = window.scene.actors["regions"]["CA1"]
+    index = QModelIndex(window.actor_items[actor])
+    assert window.hierarchy.model().itemFromIndex(index).tag == "CA1"
+
+    # clicking on the background doesn't select anything
+    window.pick(0, 0)
+    assert window.selected_region() is None
+
+
+def region_display_point(window, region):
+    """
+        Display coordinates of the vertex of a region's mesh closest
+        to its centre (regions like CA1 are curved, so their centre
+        isn't necessarily on the mesh)
+    """
+    points = window.scene.actors["regions"][region].points()
+    centre = points.mean(axis=0)
+    point = points[np.argmin(np.linalg.norm(points - centre, axis=1))]
+
+    window.vtkWidget.GetRenderWindow().Render()
+    renderer = window.scene.plotter.renderer
+    renderer.SetWorldPoint(*point, 1)
+    renderer.WorldToDisplay()
+    x, y, _ = renderer.GetDisplayPoint()
+    return int(round(x)), int(round(y))
+
+
+@pytest.mark.parametrize("merge_regions", [False, True])
+def test_pick_region(qtbot, merge_regions):
+    window = gui.MainWindow(merge_regions=merge_regions)
+    qtbot.addWidget(window)
+    window.show()
+
+    # the root mesh, in front of CA1, isn't picked
+    state = window.get_session_state()
+    state["regions"] = {"CA1": [1.0, 0.0, 0.0], "MOs": [0.0, 0.0, 1.0]}
+    window.restore_session(state)
+    assert window.scene.root is not None
+    if merge_regions:
+        qtbot.waitUntil(lambda: window.merger.is_current)
+        assert window.merger.actor in window.get_render_actors()
+
+    window.pick(*region_display_point(window, "CA1"))
+    assert window.selected_region() == "CA1"